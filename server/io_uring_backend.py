@@ -0,0 +1,331 @@
+# server/io_uring_backend.py
+#
+# Optional proactor backend: accept/recv/send are queued on an io_uring
+# submission ring and reaped in batches, so a whole wave of clients costs
+# one io_uring_enter() instead of one syscall per operation.
+# Talks to liburing through ctypes (liburing-ffi exports the inline
+# io_uring_prep_* helpers); when the library or kernel support is missing
+# the constructor raises OSError (or run() raises UnsupportedKernel on
+# the first accept) and the server falls back to asyncio.
+import ctypes, ctypes.util, errno, os, socket, time
+from server.logger_config import setup_logger
+
+logger = setup_logger()
+
+QUEUE_DEPTH = 256
+BUF_SIZE = 8192          # same as the asyncio recv size
+BUF_COUNT = 256
+BUF_GROUP = 1
+RING_STRUCT_SIZE = 512   # opaque storage, larger than sizeof(struct io_uring)
+WAIT_TIMEOUT_NS = 200_000_000
+
+IOSQE_BUFFER_SELECT = 1 << 5
+IORING_CQE_F_BUFFER = 1 << 0
+IORING_CQE_F_MORE = 1 << 1
+IORING_CQE_BUFFER_SHIFT = 16
+
+OP_ACCEPT, OP_RECV, OP_SEND, OP_CLOSE, OP_PROVIDE = range(1, 6)
+
+
+class io_uring_sqe(ctypes.Structure):
+    _fields_ = [
+        ("opcode", ctypes.c_uint8),
+        ("flags", ctypes.c_uint8),
+        ("ioprio", ctypes.c_uint16),
+        ("fd", ctypes.c_int32),
+        ("off", ctypes.c_uint64),
+        ("addr", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("rw_flags", ctypes.c_uint32),
+        ("user_data", ctypes.c_uint64),
+        ("buf_group", ctypes.c_uint16),
+        ("personality", ctypes.c_uint16),
+        ("splice_fd_in", ctypes.c_int32),
+        ("addr3", ctypes.c_uint64),
+        ("pad2", ctypes.c_uint64),
+    ]
+
+
+class io_uring_cqe(ctypes.Structure):
+    _fields_ = [
+        ("user_data", ctypes.c_uint64),
+        ("res", ctypes.c_int32),
+        ("flags", ctypes.c_uint32),
+    ]
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class kernel_timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_int64), ("tv_nsec", ctypes.c_longlong)]
+
+
+class UnsupportedKernel(OSError):
+    """The running kernel lacks an io_uring feature the backend needs."""
+
+
+_lib = None
+
+
+def _load_lib():
+    global _lib
+    if _lib is not None:
+        return _lib
+    for name in (ctypes.util.find_library("uring-ffi"), "liburing-ffi.so.2", "liburing-ffi.so"):
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name, use_errno=True)
+        except OSError:
+            continue
+
+        sqe_p = ctypes.POINTER(io_uring_sqe)
+        cqe_pp = ctypes.POINTER(ctypes.POINTER(io_uring_cqe))
+        vp = ctypes.c_void_p
+        for fname, args, res in (
+            ("io_uring_queue_init", [ctypes.c_uint, vp, ctypes.c_uint], ctypes.c_int),
+            ("io_uring_queue_exit", [vp], None),
+            ("io_uring_get_sqe", [vp], sqe_p),
+            ("io_uring_submit", [vp], ctypes.c_int),
+            ("io_uring_submit_and_wait_timeout",
+             [vp, cqe_pp, ctypes.c_uint, ctypes.POINTER(kernel_timespec), vp], ctypes.c_int),
+            ("io_uring_peek_batch_cqe", [vp, cqe_pp, ctypes.c_uint], ctypes.c_uint),
+            ("io_uring_cq_advance", [vp, ctypes.c_uint], None),
+            ("io_uring_sqe_set_data64", [sqe_p, ctypes.c_uint64], None),
+            ("io_uring_prep_multishot_accept", [sqe_p, ctypes.c_int, vp, vp, ctypes.c_int], None),
+            ("io_uring_prep_recv", [sqe_p, ctypes.c_int, vp, ctypes.c_size_t, ctypes.c_int], None),
+            ("io_uring_prep_sendmsg", [sqe_p, ctypes.c_int, ctypes.POINTER(msghdr), ctypes.c_uint], None),
+            ("io_uring_prep_close", [sqe_p, ctypes.c_int], None),
+            ("io_uring_prep_provide_buffers",
+             [sqe_p, vp, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int], None),
+        ):
+            try:
+                fn = getattr(lib, fname)
+            except AttributeError:
+                break
+            fn.argtypes = args
+            fn.restype = res
+        else:
+            _lib = lib
+            return _lib
+    return None
+
+
+class IoUringBackend:
+    """Runs WebServer's request handling on an io_uring completion loop."""
+
+    def __init__(self, server):
+        lib = _load_lib()
+        if lib is None:
+            raise OSError(errno.ENOSYS, "liburing-ffi not found")
+        self.lib = lib
+        self.server = server
+        self.ring = ctypes.create_string_buffer(RING_STRUCT_SIZE)
+        ret = lib.io_uring_queue_init(QUEUE_DEPTH, self.ring, 0)
+        if ret < 0:
+            raise OSError(-ret, os.strerror(-ret))
+        # fixed recv pool; the kernel picks a free slot per recv
+        # (IORING_OP_PROVIDE_BUFFERS) so idle sockets pin no memory
+        self.buffers = ctypes.create_string_buffer(BUF_SIZE * BUF_COUNT)
+        self.buf_base = ctypes.addressof(self.buffers)
+        self.conns = {}
+        self.accept_armed = False
+        self.accepted_any = False
+
+    # -- submission helpers --------------------------------------------
+
+    def _get_sqe(self):
+        sqe = self.lib.io_uring_get_sqe(self.ring)
+        if not sqe:
+            # submission ring full: flush it and retry once
+            self.lib.io_uring_submit(self.ring)
+            sqe = self.lib.io_uring_get_sqe(self.ring)
+            if not sqe:
+                raise OSError(errno.EBUSY, "io_uring submission queue full")
+        return sqe
+
+    def _prep_accept(self):
+        sqe = self._get_sqe()
+        self.lib.io_uring_prep_multishot_accept(
+            sqe, self.server.server_socket.fileno(), None, None, socket.SOCK_CLOEXEC)
+        self.lib.io_uring_sqe_set_data64(sqe, OP_ACCEPT)
+        self.accept_armed = True
+
+    def _prep_provide(self, bid, count=1):
+        sqe = self._get_sqe()
+        self.lib.io_uring_prep_provide_buffers(
+            sqe, self.buf_base + bid * BUF_SIZE, BUF_SIZE, count, BUF_GROUP, bid)
+        self.lib.io_uring_sqe_set_data64(sqe, OP_PROVIDE)
+
+    def _prep_recv(self, fd):
+        sqe = self._get_sqe()
+        self.lib.io_uring_prep_recv(sqe, fd, None, BUF_SIZE, 0)
+        sqe.contents.flags |= IOSQE_BUFFER_SELECT
+        sqe.contents.buf_group = BUF_GROUP
+        self.lib.io_uring_sqe_set_data64(sqe, (fd << 8) | OP_RECV)
+
+    def _prep_send(self, fd, conn):
+        # vectored send of the unsent tail of the response chunks; the
+        # iovec/msghdr live in conn until the completion arrives
+        sqe = self._get_sqe()
+        sent = conn["sent"]
+        iovs = []
+        for chunk in conn["resp"]:
+            if sent >= len(chunk):
+                sent -= len(chunk)
+                continue
+            addr = ctypes.cast(ctypes.c_char_p(chunk), ctypes.c_void_p).value
+            iovs.append((addr + sent, len(chunk) - sent))
+            sent = 0
+        iov = (iovec * len(iovs))(*iovs)
+        msg = msghdr(msg_iov=iov, msg_iovlen=len(iovs))
+        conn["iov"], conn["msg"] = iov, msg
+        self.lib.io_uring_prep_sendmsg(sqe, fd, ctypes.byref(msg), 0)
+        self.lib.io_uring_sqe_set_data64(sqe, (fd << 8) | OP_SEND)
+
+    def _prep_close(self, fd):
+        if self.conns.pop(fd, None) is not None:
+            self.server._client_done()
+        sqe = self._get_sqe()
+        self.lib.io_uring_prep_close(sqe, fd)
+        self.lib.io_uring_sqe_set_data64(sqe, (fd << 8) | OP_CLOSE)
+
+    def _drop(self, fd):
+        # close a connection after a handler error; plain close() if even
+        # the close SQE can't be had
+        try:
+            self._prep_close(fd)
+        except OSError:
+            try: os.close(fd)
+            except OSError: pass
+
+    # -- completion state machine --------------------------------------
+
+    def _on_accept(self, res, flags):
+        if not flags & IORING_CQE_F_MORE:
+            # multishot accept was terminated; run() re-arms it
+            self.accept_armed = False
+        if res < 0:
+            if res == -errno.EINVAL and not self.accepted_any:
+                # pre-5.19 kernels reject the multishot flag outright;
+                # re-arming would only spin on the same error
+                raise UnsupportedKernel(errno.EINVAL, "multishot accept not supported")
+            if self.server.running:
+                logger.error(f"[io_uring] accept failed: {os.strerror(-res)}")
+            return
+        fd = res
+        self.accepted_any = True
+        s = socket.socket(fileno=fd)
+        try:
+            ip = s.getpeername()[0]
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            ip = "unknown"
+        finally:
+            s.detach()
+        self.conns[fd] = {"ip": ip, "start": time.time(), "resp": [], "size": 0, "sent": 0}
+        self.server._client_started()
+        self._prep_recv(fd)
+
+    def _on_recv(self, fd, res, flags):
+        conn = self.conns.get(fd)
+        if conn is None:
+            return
+        if res <= 0:
+            if res < 0:
+                logger.error(f"[io_uring] recv failed: {os.strerror(-res)}")
+            self._prep_close(fd)
+            return
+        bid = flags >> IORING_CQE_BUFFER_SHIFT
+        raw = ctypes.string_at(self.buf_base + bid * BUF_SIZE, res)
+        # hand the slot straight back to the kernel
+        self._prep_provide(bid)
+
+        resp, path, status_code, device = self.server._serve_sync(conn["ip"], raw)
+        conn.update(resp=resp, size=sum(len(c) for c in resp),
+                    path=path, status_code=status_code, device=device)
+        self._prep_send(fd, conn)
+
+    def _on_send(self, fd, res):
+        conn = self.conns.get(fd)
+        if conn is None:
+            return
+        if res < 0:
+            logger.error(f"[io_uring] send failed: {os.strerror(-res)}")
+            self._prep_close(fd)
+            return
+        conn["sent"] += res
+        if conn["sent"] < conn["size"]:
+            self._prep_send(fd, conn)
+            return
+        rt = time.time() - conn["start"]
+        self.server.record(conn["ip"], conn["path"], rt, conn["status_code"], conn["device"])
+        self._prep_close(fd)
+
+    def _complete(self, user_data, res, flags):
+        op, fd = user_data & 0xFF, user_data >> 8
+        try:
+            if op == OP_ACCEPT:
+                self._on_accept(res, flags)
+            elif op == OP_RECV:
+                self._on_recv(fd, res, flags)
+            elif op == OP_SEND:
+                self._on_send(fd, res)
+            elif op == OP_PROVIDE and res < 0:
+                logger.error(f"[io_uring] provide buffers failed: {os.strerror(-res)}")
+        except UnsupportedKernel:
+            raise
+        except Exception as e:
+            # one bad request must not take the ring down with it
+            logger.error(f"[io_uring] client error: {e}")
+            if op == OP_ACCEPT:
+                fd = res
+            if fd in self.conns:
+                self._drop(fd)
+
+    def run(self):
+        lib = self.lib
+        cqes = (ctypes.POINTER(io_uring_cqe) * QUEUE_DEPTH)()
+        cqe_ptr = ctypes.POINTER(io_uring_cqe)()
+        ts = kernel_timespec(0, WAIT_TIMEOUT_NS)
+
+        self._prep_provide(0, BUF_COUNT)
+        try:
+            while self.server.running:
+                if not self.accept_armed:
+                    try:
+                        self._prep_accept()
+                    except OSError as e:
+                        logger.error(f"[io_uring] cannot arm accept: {e}")
+                # one syscall submits everything queued by the last batch
+                # and waits for at least one completion
+                ret = lib.io_uring_submit_and_wait_timeout(
+                    self.ring, ctypes.byref(cqe_ptr), 1, ctypes.byref(ts), None)
+                if ret < 0 and -ret not in (errno.ETIME, errno.EINTR):
+                    raise OSError(-ret, os.strerror(-ret))
+                n = lib.io_uring_peek_batch_cqe(self.ring, cqes, QUEUE_DEPTH)
+                for i in range(n):
+                    c = cqes[i].contents
+                    self._complete(c.user_data, c.res, c.flags)
+                lib.io_uring_cq_advance(self.ring, n)
+        finally:
+            for fd in list(self.conns):
+                self.conns.pop(fd, None)
+                self.server._client_done()
+                try: os.close(fd)
+                except OSError: pass
+            lib.io_uring_queue_exit(self.ring)
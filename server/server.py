@@ -1,103 +1,406 @@
 # server/server.py
-import socket, threading, time, os, uuid, random
-from datetime import datetime
+import asyncio, socket, threading, time, os, re, uuid, random, weakref, zlib
+from collections import Counter, deque
+from itertools import islice
 from http import HTTPStatus
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 from server.threadpool import ThreadPool
+from server.structures import AtomicCounter, BufferPool, LatencyWindow, LRUDict, counter_for
+from server import io_uring_backend
 from server.logger_config import setup_logger
-import statistics
+
+try:
+    # optional C parser (the one uvicorn uses); falls back to str.split
+    import httptools
+except ImportError:
+    httptools = None
 
 logger = setup_logger()
 
-metrics_lock = threading.Lock()
+MAX_RECENT = 100
+MAX_LAT = 120
+MAX_CACHED_FILES = 256
+MAX_SESSIONS = 10_000
+SESSION_SHARDS = 32  # power of two, see _session_shard
+# per-thread request batches are applied after this many or this long
+FLUSH_EVERY = 16
+FLUSH_INTERVAL = 0.1
+
+# each piece of shared state has its own synchronization: every counter
+# has a private lock held for one addition, the response-time window is
+# sharded, and the ordered history deques and each session shard take
+# (separate) locks
+history_lock = threading.Lock()
+cache_lock = threading.Lock()
 
 metrics = {
-    "active_clients": 0,
-    "total_requests": 0,
-    "average_response_time": 0.0,
-    "recent_requests": [],
+    "active_clients": AtomicCounter(),
+    "total_requests": AtomicCounter(),
+    "recent_requests": deque(maxlen=MAX_RECENT),
     "cache_enabled": True,
-    "cache_hits": 0,
-    "cache_misses": 0,
-    "response_times": [],
-    "unique_sessions": 0,
+    "cache_hits": AtomicCounter(),
+    "cache_misses": AtomicCounter(),
+    "response_times": LatencyWindow(2000),
     "thread_pool_size": 10,
     "queue_size": 0,
-    "latency_trend": [],
+    "latency_trend": deque(maxlen=MAX_LAT),
     # status code breakdown
-    "status_codes": {"200": 0, "400": 0, "404": 0, "500": 0},
+    "status_codes": {code: AtomicCounter() for code in ("200", "400", "404", "500")},
     # geo (simulated) distribution
-    "geo": {}
+    "geo": {},
+    # bumped on every change the dashboard can see; see _get_metrics_copy
+    "version": AtomicCounter()
 }
 
-session_data: Dict[str, Dict[str, Any]] = {}
-file_cache: Dict[str, Any] = {}
+_tls = threading.local()
+_pending_registry = weakref.WeakSet()
+_registry_lock = threading.Lock()
 
-MAX_RECENT = 100
-MAX_LAT = 120
+
+class _PendingStats:
+    # per-thread queue of finished requests not yet applied to metrics.
+    # deque append/popleft are atomic, so the dashboard thread can drain
+    # another thread's queue while it keeps appending.
+    __slots__ = ("items", "last_flush", "__weakref__")
+
+    def __init__(self):
+        self.items = deque()
+        self.last_flush = time.monotonic()
+
+
+def _pending_stats():
+    pending = getattr(_tls, "pending", None)
+    if pending is None:
+        pending = _tls.pending = _PendingStats()
+        with _registry_lock:
+            _pending_registry.add(pending)
+    return pending
+
+
+def _flush_pending(pending):
+    pending.last_flush = time.monotonic()
+    batch = []
+    try:
+        while True:
+            batch.append(pending.items.popleft())
+    except IndexError:
+        pass
+    if batch:
+        _apply_records(batch)
+
+
+def _flush_all_pending():
+    with _registry_lock:
+        pendings = list(_pending_registry)
+    for pending in pendings:
+        _flush_pending(pending)
+
+
+def _apply_records(batch):
+    metrics["total_requests"].add(len(batch))
+    metrics["response_times"].extend([rt for _, _, rt, _, _, _ in batch])
+    countries = [guess_country_from_ip(ip) for ip, *_ in batch]
+    for code, n in Counter(str(r[3]) for r in batch).items():
+        counter_for(metrics["status_codes"], code).add(n)
+    # geo counters
+    for country, n in Counter(countries).items():
+        counter_for(metrics["geo"], country).add(n)
+
+    with history_lock:
+        for (ip, path, rt, status_code, _, ts), country in zip(batch, countries):
+            metrics["latency_trend"].append(rt * 1000.0)
+            metrics["recent_requests"].appendleft({
+                "ip": ip,
+                "path": path,
+                "response_time": round(rt, 4),
+                "status_code": status_code,
+                "time": ts,
+                "country": country
+            })
+
+    # session book-keeping (ip grouped)
+    for ip, path, _, _, device, ts in batch:
+        shard, lock = _session_shard(ip)
+        with lock:
+            s = shard[ip]
+            s["hit_count"] = s.get("hit_count", 0) + 1
+            s["last_seen"] = ts
+            s["last_path"] = path
+            s["device_type"] = device
+
+    metrics["version"].inc()
+
+
+# written under cache_lock; lookups use the atomic get/move_to_end
+file_cache: Dict[str, Any] = LRUDict(MAX_CACHED_FILES)
+
+STATIC_DIR = os.path.join("server", "static")
+# files at least this big are sent with sendfile instead of from memory
+SENDFILE_MIN = 16 * 1024
+# artificial per-request delay for demoing latency graphs; off by default
+SIMULATE_LATENCY = os.getenv("SIMULATE_LATENCY", "0") == "1"
+
+RECV_SIZE = 8192
+_recv_buffers = BufferPool(RECV_SIZE)
+
+_STATUS_LINES = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    500: b"HTTP/1.1 500 Internal Server Error\r\n",
+}
+
+
+def _status_line(status_code):
+    line = _STATUS_LINES.get(status_code)
+    if line is None:
+        line = b"HTTP/1.1 %d %s\r\n" % (status_code, HTTPStatus(status_code).phrase.encode("ascii"))
+    return line
+
+
+BAD_REQUEST_RESPONSE = _STATUS_LINES[400] + b"Content-Length:11\r\n\r\nBad Request"
+
+
+def _header_template(status_code, length):
+    return _status_line(status_code) + b"Content-Type: text/html\r\nContent-Length: %d\r\n" % length
+
+
+def _make_entry(body_bytes: bytes, status_code=200):
+    # encoded once when the file is cached; serving it only appends the
+    # per-client cookie line
+    return {
+        "body_bytes": body_bytes,
+        "len": len(body_bytes),
+        "header_template": _header_template(status_code, len(body_bytes)),
+    }
+
+
+def _make_file_entry(loc, st):
+    # large files are cached as metadata only and streamed with sendfile;
+    # size and mtime tell when the template has to be rebuilt
+    return {
+        "body_bytes": None,
+        "loc": loc,
+        "len": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "header_template": _header_template(200, st.st_size),
+    }
+
+
+def _load_entry(loc):
+    with open(loc, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_size >= SENDFILE_MIN:
+            return _make_file_entry(loc, st)
+        return _make_entry(f.read())
+
+
+def _is_stale(entry):
+    if entry["body_bytes"] is not None:
+        return False
+    try:
+        st = os.stat(entry["loc"])
+    except OSError:
+        return True
+    return st.st_size != entry["len"] or st.st_mtime_ns != entry["mtime"]
+
+
+NOT_FOUND_ENTRY = _make_entry(b"<h1>404 - Not Found</h1>", 404)
+READ_ERROR_ENTRY = _make_entry(b"<h1>500 - File read error</h1>", 500)
+
+
+def _new_session():
+    ts = now()
+    return {
+        "session_id": uuid.uuid4().hex[:16],
+        "first_seen": ts,
+        "last_seen": ts,
+        "hit_count": 0,
+        "last_path": None,
+        "device_type": "unknown"
+    }
+
+
+# sessions are spread over independently locked shards by ip hash so
+# concurrent clients rarely wait on each other's bookkeeping
+session_shards: List[Tuple[Dict[str, Dict[str, Any]], threading.Lock]] = [
+    (LRUDict(MAX_SESSIONS // SESSION_SHARDS, _new_session), threading.Lock())
+    for _ in range(SESSION_SHARDS)
+]
+
+
+def _session_shard(ip: str):
+    return session_shards[hash(ip) & (SESSION_SHARDS - 1)]
+
+
+def _session_summary(limit: int):
+    summary = []
+    for shard, lock in session_shards:
+        if len(summary) >= limit:
+            break
+        with lock:
+            summary.extend(
+                {
+                    "session_id": s["session_id"],
+                    "first_seen": s["first_seen"],
+                    "last_seen": s["last_seen"],
+                    "hit_count": s["hit_count"],
+                    "last_path": s.get("last_path"),
+                    "device_type": s.get("device_type", "unknown")
+                } for s in islice(shard.values(), limit - len(summary))
+            )
+    return summary
+
+
+class _RequestHandler:
+    # httptools parser callbacks, fed straight from the recv bytes
+    __slots__ = ("url", "headers")
+
+    def __init__(self):
+        self.url = b""
+        self.headers = {}
+
+    def on_url(self, url):
+        self.url += url
+
+    def on_header(self, name, value):
+        self.headers[name.decode("latin-1")] = value.decode("latin-1").strip()
+
+
+_MOBILE_RE = re.compile(r"mobile|android|iphone", re.IGNORECASE)
+_TABLET_RE = re.compile(r"tablet|ipad", re.IGNORECASE)
 
 
 def detect_device(ua: str):
-    ua = (ua or "").lower()
-    if "mobile" in ua or "android" in ua or "iphone" in ua:
+    # one C-level scan per pattern instead of lower() plus five `in` checks
+    ua = ua or ""
+    if _MOBILE_RE.search(ua):
         return "mobile"
-    if "tablet" in ua or "ipad" in ua:
+    if _TABLET_RE.search(ua):
         return "tablet"
     return "desktop"
 
 
+_ts_cache = (0, "")
+
+
 def now():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # strftime once per second; the (second, text) pair is swapped in as
+    # one tuple so other threads never see a mismatched half
+    global _ts_cache
+    t = int(time.time())
+    cached = _ts_cache
+    if t != cached[0]:
+        cached = _ts_cache = (t, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)))
+    return cached[1]
+
+
+_GEO_BUCKETS = ("IN", "US", "GB", "DE", "FR", "AU", "BR")
 
 
 def guess_country_from_ip(ip: str):
     # lightweight deterministic pseudo-geo for demo (no external API).
-    # This keeps the project offline and safe.
-    buckets = ["IN", "US", "GB", "DE", "FR", "AU", "BR"]
-    idx = sum(ord(c) for c in ip) % len(buckets)
-    return buckets[idx]
+    # This keeps the project offline and safe. crc32 runs in C and, unlike
+    # hash(), is stable across restarts.
+    return _GEO_BUCKETS[zlib.crc32(ip.encode("ascii", "ignore")) % len(_GEO_BUCKETS)]
+
+
+async def _send_vectored(loop, sock, chunks):
+    # one sendmsg (writev) for all chunks; only after a short write does
+    # the loop take over the remainder
+    try:
+        sent = sock.sendmsg(chunks)
+    except (BlockingIOError, InterruptedError):
+        sent = 0
+    for chunk in chunks:
+        if sent >= len(chunk):
+            sent -= len(chunk)
+            continue
+        await loop.sock_sendall(sock, memoryview(chunk)[sent:])
+        sent = 0
 
 
 class WebServer:
-    def __init__(self, host="127.0.0.1", port=8081, num_threads=10):
+    def __init__(self, host="127.0.0.1", port=8081, num_threads=10, backend=None):
         self.host = host
         self.port = port
         self.running = False
+        # "asyncio" (default, epoll) or "io_uring" (needs liburing-ffi)
+        self.backend = backend or os.getenv("SERVER_BACKEND", "asyncio")
         self.thread_pool = ThreadPool(num_threads)
-        os.makedirs("server/static", exist_ok=True)
-        with metrics_lock:
-            metrics["thread_pool_size"] = num_threads
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        metrics["thread_pool_size"] = num_threads
+        if metrics["cache_enabled"]:
+            self._preload_static()
 
     def start(self):
         try:
             s = socket.socket()
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind((self.host, self.port))
-            s.listen(300)
+            s.listen(1024)
+            s.setblocking(False)
             self.server_socket = s
             self.running = True
             logger.info(f"[WebServer] Running at http://{self.host}:{self.port}")
         except Exception as e:
-            logger.error("Cannot bind:", e)
+            logger.error(f"Cannot bind: {e}")
             return
 
-        while self.running:
+        uring = None
+        if self.backend == "io_uring":
             try:
-                client, addr = self.server_socket.accept()
-                self.thread_pool.submit(self.handle_client, client, addr)
-                with metrics_lock:
-                    try:
-                        metrics["queue_size"] = self.thread_pool.get_queue_size()
-                    except Exception:
-                        metrics["queue_size"] = 0
-            except Exception:
-                # continue accepting
-                pass
+                uring = io_uring_backend.IoUringBackend(self)
+                logger.info("[WebServer] Using io_uring backend")
+            except OSError as e:
+                logger.warning(f"[WebServer] io_uring unavailable ({e}), falling back to asyncio")
 
+        try:
+            if uring is not None:
+                try:
+                    uring.run()
+                except io_uring_backend.UnsupportedKernel as e:
+                    logger.warning(f"[WebServer] io_uring unavailable ({e}), falling back to asyncio")
+                    uring = None
+            if uring is None and self.running:
+                asyncio.run(self._serve())
+        except Exception as e:
+            logger.error(f"Event loop error: {e}")
         self.stop()
 
+    async def _serve(self):
+        # single-threaded accept loop; the default loop multiplexes every
+        # client socket over epoll instead of parking one thread per request
+        self._loop = asyncio.get_running_loop()
+        self._serve_task = asyncio.current_task()
+        tasks = set()
+        try:
+            while self.running:
+                try:
+                    client, addr = await self._loop.sock_accept(self.server_socket)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # continue accepting
+                    continue
+                t = self._loop.create_task(self.handle_client(client, addr))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for t in list(tasks):
+                t.cancel()
+
     def stop(self):
         self.running = False
+        loop, task = getattr(self, "_loop", None), getattr(self, "_serve_task", None)
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # loop already closed
+                pass
         try:
             self.server_socket.close()
         except Exception:
@@ -108,240 +411,295 @@ class WebServer:
             pass
         logger.info("[WebServer] Stopped")
 
-    def handle_client(self, sock, addr):
+    async def handle_client(self, sock, addr):
         ip = addr[0]
         start = time.time()
-        with metrics_lock:
-            metrics["active_clients"] += 1
+        loop = asyncio.get_running_loop()
+        self._client_started()
 
         try:
-            req = sock.recv(8192).decode(errors="ignore")
-            if not req:
+            # responses are small: don't let Nagle hold them back
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # read into a pooled buffer and parse straight from a view of it;
+            # the parsers copy what they keep, so it goes back right after
+            buf = _recv_buffers.acquire()
+            try:
+                n = await loop.sock_recv_into(sock, buf)
+                parsed = self._parse_request(memoryview(buf)[:n]) if n else None
+            finally:
+                _recv_buffers.release(buf)
+            if not n:
                 return
 
-            lines = req.split("\r\n")
-            first = lines[0] if lines else ""
-            parts = first.split()
-            if len(parts) < 3:
-                # bad request
-                resp = b"HTTP/1.1 400 Bad Request\r\nContent-Length:11\r\n\r\nBad Request"
-                try: sock.sendall(resp)
+            if parsed is None:
+                try: await loop.sock_sendall(sock, BAD_REQUEST_RESPONSE)
                 except: pass
                 status_code = 400
                 rt = time.time() - start
                 self.record(ip, "/", rt, status_code, "unknown")
                 return
-
-            method, path, proto = parts
-            if path == "/":
-                path = "/index.html"
+            method, path, headers = parsed
 
             # small random processing to make spikes visible
-            if path == "/slow":
-                time.sleep(random.uniform(0.6, 1.2))
+            if SIMULATE_LATENCY:
+                if path == "/slow":
+                    await asyncio.sleep(random.uniform(0.6, 1.2))
+                else:
+                    await asyncio.sleep(random.uniform(0.02, 0.18))
+
+            # in-memory cache hits are served right here; misses and the
+            # stat behind a sendfile entry's staleness check are blocking,
+            # so those go to the thread pool instead of stalling the loop
+            entry = self._cache_hit(path, stat_ok=False)
+            if entry is not None:
+                status_code = 200
             else:
-                time.sleep(random.uniform(0.02, 0.18))
-
-            headers = {}
-            for line in lines[1:]:
-                if ":" in line:
-                    k, v = line.split(":", 1)
-                    headers[k.strip()] = v.strip()
-
-            # produce response (cache aware)
-            body, status_code = self.get_file(path, headers)
+                fut = loop.run_in_executor(self.thread_pool, self.get_file, path, headers)
+                metrics["queue_size"] = self.thread_pool.get_queue_size()
+                entry, status_code = await fut
 
-            # build response, send cookie
-            cookie = f"Set-Cookie: SESSION_ID={self._ensure_session_for_ip(ip)}; Path=/; HttpOnly\r\n"
-            body_bytes = body.encode("utf-8", errors="ignore")
-            resp_headers = (
-                f"HTTP/1.1 {status_code} {'OK' if status_code==200 else ''}\r\n"
-                f"Content-Type: text/html\r\n"
-                f"{cookie}"
-                f"Content-Length: {len(body_bytes)}\r\n\r\n"
-            ).encode("utf-8")
-
-            sock.sendall(resp_headers + body_bytes)
+            await _send_vectored(loop, sock, self._build_response(ip, entry))
+            if entry["body_bytes"] is None:
+                # kernel-to-kernel copy; the body never enters Python
+                with open(entry["loc"], "rb") as f:
+                    await loop.sock_sendfile(sock, f, 0, entry["len"])
 
             rt = time.time() - start
             device = detect_device(headers.get("User-Agent", ""))
             self.record(ip, path, rt, status_code, device)
 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Client error: {e}")
         finally:
             try: sock.close()
             except: pass
-            with metrics_lock:
-                metrics["active_clients"] = max(0, metrics["active_clients"] - 1)
+            self._client_done()
+
+    # connection gauges stay per-event: each is one uncontended counter
+    # lock, and batching them would make active_clients lag behind
+    def _client_started(self):
+        metrics["active_clients"].inc()
+        metrics["version"].inc()
+
+    def _client_done(self):
+        metrics["active_clients"].dec()
+        metrics["version"].inc()
+
+    def _serve_sync(self, ip, raw):
+        # non-blocking counterpart of handle_client for completion-driven
+        # backends: never applies SIMULATE_LATENCY, file read inline (served
+        # from cache after the first hit; sendfile-sized files are read into
+        # the response). Returns (response, path, status, device).
+        parsed = self._parse_request(raw)
+        if parsed is None:
+            return [BAD_REQUEST_RESPONSE], "/", 400, "unknown"
+        method, path, headers = parsed
+        entry, status_code = self.get_file(path, headers)
+        device = detect_device(headers.get("User-Agent", ""))
+        chunks = self._build_response(ip, entry)
+        if entry["body_bytes"] is None:
+            with open(entry["loc"], "rb") as f:
+                chunks.append(f.read(entry["len"]))
+        return chunks, path, status_code, device
+
+    def _parse_request(self, raw):
+        # returns (method, path, headers) or None for a malformed request line
+        if httptools is not None:
+            return self._parse_request_fast(raw)
+
+        req = str(raw, "utf-8", "ignore")
+        lines = req.split("\r\n")
+        first = lines[0] if lines else ""
+        parts = first.split()
+        if len(parts) != 3:
+            return None
+
+        method, path, proto = parts
+        if path == "/":
+            path = "/index.html"
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip()] = v.strip()
+        return method, path, headers
+
+    def _parse_request_fast(self, raw):
+        handler = _RequestHandler()
+        parser = httptools.HttpRequestParser(handler)
+        try:
+            parser.feed_data(raw)
+        except httptools.HttpParserUpgrade:
+            # headers are complete at this point; serve it like any GET
+            pass
+        except httptools.HttpParserError:
+            return None
+        if not handler.url:
+            return None
+
+        path = handler.url.decode("latin-1")
+        if path == "/":
+            path = "/index.html"
+        return parser.get_method().decode("latin-1"), path, handler.headers
+
+    def _build_response(self, ip, entry):
+        # build response, send cookie; the entry already carries encoded
+        # status/type/length headers and body. Returned as [headers, body]
+        # for a vectored send so the body is never copied; sendfile entries
+        # only produce the headers
+        cookie = b"Set-Cookie: SESSION_ID=%s; Path=/; HttpOnly\r\n\r\n" % (
+            self._ensure_session_for_ip(ip).encode("ascii"))
+        head = entry["header_template"] + cookie
+        if entry["body_bytes"] is None:
+            return [head]
+        return [head, entry["body_bytes"]]
 
     def _ensure_session_for_ip(self, ip):
         # create a simple session id per ip if not present
-        if ip in session_data:
-            return session_data[ip]["session_id"]
-        sid = uuid.uuid4().hex[:16]
-        session_data[ip] = {
-            "session_id": sid,
-            "first_seen": now(),
-            "last_seen": now(),
-            "hit_count": 0,
-            "last_path": None,
-            "device_type": "unknown"
-        }
-        with metrics_lock:
-            metrics["unique_sessions"] = len(session_data)
-        return sid
+        shard, lock = _session_shard(ip)
+        with lock:
+            return shard[ip]["session_id"]
+
+    def _preload_static(self):
+        # warm the cache with everything under server/static once
+        for root, _, files in os.walk(STATIC_DIR):
+            for name in files:
+                loc = os.path.join(root, name)
+                path = "/" + os.path.relpath(loc, STATIC_DIR).replace(os.sep, "/")
+                try:
+                    entry = _load_entry(loc)
+                except OSError:
+                    continue
+                with cache_lock:
+                    file_cache[path] = entry
+
+    def _cache_hit(self, path, stat_ok=True):
+        # cached entry for path, or None. A sendfile entry costs an os.stat
+        # to rule out staleness; with stat_ok=False it is left to get_file
+        entry = file_cache.get(path) if metrics["cache_enabled"] else None
+        if entry is None:
+            return None
+        if entry["body_bytes"] is None and (not stat_ok or _is_stale(entry)):
+            return None
+        metrics["cache_hits"].inc()
+        try:
+            file_cache.move_to_end(path)
+        except KeyError:
+            # evicted by another thread meanwhile
+            pass
+        return entry
 
     def get_file(self, path, headers=None):
         if headers is None: headers = {}
-        # cache check
-        if metrics["cache_enabled"] and path in file_cache:
-            with metrics_lock:
-                metrics["cache_hits"] += 1
-            return file_cache[path]["body"], 200
-
-        with metrics_lock:
-            metrics["cache_misses"] += 1
-
-        loc = os.path.join("server", "static", path.lstrip("/"))
-        if os.path.exists(loc) and os.path.isfile(loc):
-            try:
-                with open(loc, "r", encoding="utf8") as f:
-                    body = f.read()
-            except Exception:
-                body = "<h1>500 - File read error</h1>"
-                return body, 500
-            resp = {"body": body}
-            if metrics["cache_enabled"]:
-                try:
-                    file_cache[path] = resp
-                except Exception:
-                    pass
-            return body, 200
-        return "<h1>404 - Not Found</h1>", 404
+        entry = self._cache_hit(path)
+        if entry is not None:
+            return entry, 200
+
+        metrics["cache_misses"].inc()
+
+        # just open it: one syscall instead of exists + isfile + open, and
+        # no window for the file to vanish between the checks
+        loc = os.path.normpath(os.path.join(STATIC_DIR, path.lstrip("/")))
+        # never serve anything outside server/static; normpath has folded
+        # any ".." segments, so a prefix test needs no syscalls
+        if not loc.startswith(STATIC_DIR + os.sep):
+            return NOT_FOUND_ENTRY, 404
+        try:
+            resp = _load_entry(loc)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError, ValueError):
+            # ValueError: NUL byte in the path
+            return NOT_FOUND_ENTRY, 404
+        except OSError:
+            return READ_ERROR_ENTRY, 500
+        if metrics["cache_enabled"]:
+            with cache_lock:
+                file_cache[path] = resp
+        return resp, 200
 
     def record(self, ip, path, rt, status_code, device):
-        country = guess_country_from_ip(ip)
-        with metrics_lock:
-            metrics["total_requests"] += 1
-            metrics["response_times"].append(rt)
-            metrics["response_times"] = metrics["response_times"][-2000:]
+        # queue locally; shared metrics are touched once per batch
+        pending = _pending_stats()
+        pending.items.append((ip, path, rt, status_code, device, now()))
+        if (len(pending.items) >= FLUSH_EVERY
+                or time.monotonic() - pending.last_flush >= FLUSH_INTERVAL):
+            _flush_pending(pending)
 
-            try:
-                metrics["average_response_time"] = sum(metrics["response_times"]) / len(metrics["response_times"])
-            except Exception:
-                metrics["average_response_time"] = 0.0
-
-            metrics["latency_trend"].append(rt * 1000.0)
-            metrics["latency_trend"] = metrics["latency_trend"][-MAX_LAT:]
-
-            code_str = str(status_code)
-            if code_str not in metrics["status_codes"]:
-                metrics["status_codes"][code_str] = 0
-            metrics["status_codes"][code_str] += 1
-
-            metrics["recent_requests"].insert(0, {
-                "ip": ip,
-                "path": path,
-                "response_time": round(rt, 4),
-                "status_code": status_code,
-                "time": now(),
-                "country": country
-            })
-            metrics["recent_requests"] = metrics["recent_requests"][:MAX_RECENT]
-
-            # session book-keeping (ip grouped)
-            if ip not in session_data:
-                session_data[ip] = {
-                    "session_id": uuid.uuid4().hex[:16],
-                    "first_seen": now(),
-                    "last_seen": now(),
-                    "hit_count": 0,
-                    "last_path": None,
-                    "device_type": device
-                }
-            s = session_data[ip]
-            s["hit_count"] = s.get("hit_count", 0) + 1
-            s["last_seen"] = now()
-            s["last_path"] = path
-            s["device_type"] = device
+    def get_session_summary(self, limit=20):
+        return _session_summary(limit)
 
-            # geo counters
-            if country not in metrics["geo"]:
-                metrics["geo"][country] = 0
-            metrics["geo"][country] += 1
 
-    def get_session_summary(self, limit=20):
-        with metrics_lock:
-            return [
-                {
-                    "session_id": s["session_id"],
-                    "first_seen": s["first_seen"],
-                    "last_seen": s["last_seen"],
-                    "hit_count": s["hit_count"],
-                    "last_path": s.get("last_path"),
-                    "device_type": s.get("device_type", "unknown")
-                } for s in list(session_data.values())[:limit]
-            ]
+def _calc_percentiles(window: LatencyWindow, pct: float):
+    return round(window.percentile_ms(pct), 2)
 
 
-def _calc_percentiles(times: List[float], pct: float):
-    if not times:
-        return 0.0
-    try:
-        return round(1000.0 * statistics.quantiles(times, n=100)[int(pct)-1], 2)
-    except Exception:
-        # fallback simple
-        times_ms = sorted(t * 1000.0 for t in times)
-        idx = max(0, int(len(times_ms) * pct/100) - 1)
-        return round(times_ms[idx], 2)
+# last snapshot handed out, replaced as a whole (never mutated)
+_snapshot = {"version": -1, "data": None}
+_snapshot_lock = threading.Lock()
 
 
 def _get_metrics_copy():
-    with metrics_lock:
-        times = list(metrics.get("response_times", []))
-        p95 = _calc_percentiles(times, 95)
-        p99 = _calc_percentiles(times, 99)
-        
-        session_summary = [
-            {
-                "session_id": s["session_id"],
-                "first_seen": s["first_seen"],
-                "last_seen": s["last_seen"],
-                "hit_count": s["hit_count"],
-                "last_path": s.get("last_path"),
-                "device_type": s.get("device_type", "unknown")
-            } for s in list(session_data.values())[:20]
-        ]
-        
-        return {
-            "active_clients": int(metrics.get("active_clients", 0)),
-            "total_requests": int(metrics.get("total_requests", 0)),
-            "average_response_time": round(float(metrics.get("average_response_time", 0.0)), 4),
-            "p95_ms": p95,
-            "p99_ms": p99,
-            "recent_requests": list(metrics.get("recent_requests", []))[:20],
-            "cache_enabled": bool(metrics.get("cache_enabled", True)),
-            "cache_hits": int(metrics.get("cache_hits", 0)),
-            "cache_misses": int(metrics.get("cache_misses", 0)),
-            "unique_sessions": int(len(session_data)),
-            "thread_pool_size": int(metrics.get("thread_pool_size", 0)),
-            "queue_size": int(metrics.get("queue_size", 0)),
-            "latency_trend": list(metrics.get("latency_trend", []))[-MAX_LAT:],
-            "status_codes": dict(metrics.get("status_codes", {})),
-            "geo": dict(metrics.get("geo", {})),
-            "session_summary": session_summary
-        }
+    # rebuild only if something changed since the last poll. Writers
+    # update metrics first and bump the version after, and reading the
+    # version changes nothing, so a snapshot tagged with version v holds
+    # every change up to v; one that lands mid-build just forces another
+    # rebuild next time. Callers must not mutate the result.
+    global _snapshot
+    # pull in requests still queued on the worker threads
+    _flush_all_pending()
+    version = metrics["version"].value()
+    snap = _snapshot
+    if snap["version"] == version:
+        return snap["data"]
+
+    p95 = _calc_percentiles(metrics["response_times"], 95)
+    p99 = _calc_percentiles(metrics["response_times"], 99)
+    avg = metrics["response_times"].mean()
+
+    with history_lock:
+        recent = list(islice(metrics["recent_requests"], 20))
+        trend = list(metrics["latency_trend"])
+
+    unique_sessions = sum(len(shard) for shard, _ in session_shards)
+    session_summary = _session_summary(20)
+
+    data = {
+        "active_clients": max(0, metrics["active_clients"].value()),
+        "total_requests": metrics["total_requests"].value(),
+        "average_response_time": round(avg, 4),
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "recent_requests": recent,
+        "cache_enabled": bool(metrics.get("cache_enabled", True)),
+        "cache_hits": metrics["cache_hits"].value(),
+        "cache_misses": metrics["cache_misses"].value(),
+        "file_cache_size": len(file_cache),
+        "unique_sessions": unique_sessions,
+        "thread_pool_size": int(metrics.get("thread_pool_size", 0)),
+        "queue_size": int(metrics.get("queue_size", 0)),
+        "latency_trend": trend,
+        "status_codes": {k: c.value() for k, c in list(metrics["status_codes"].items())},
+        "geo": {k: c.value() for k, c in list(metrics["geo"].items())},
+        "session_summary": session_summary
+    }
+    with _snapshot_lock:
+        # a slower concurrent poll must not put back an older snapshot
+        if version > _snapshot["version"]:
+            _snapshot = {"version": version, "data": data}
+    return data
 
 
 get_metrics = _get_metrics_copy
 
 
 def toggle_cache():
-    with metrics_lock:
+    with cache_lock:
         metrics["cache_enabled"] = not metrics.get("cache_enabled", True)
         if not metrics["cache_enabled"]:
             file_cache.clear()
+        metrics["version"].inc()
         return metrics["cache_enabled"]
 
 
@@ -349,5 +707,5 @@ server_instance = WebServer()
 
 
 def start_internal_server():
-    # launches server in background thread
+    # launches server in background thread (start() runs its own event loop)
     threading.Thread(target=server_instance.start, daemon=True).start()
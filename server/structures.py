@@ -0,0 +1,189 @@
+# server/structures.py
+# Small thread-safe containers used by the metrics code so that request
+# handlers never have to queue up on one global lock.
+import itertools
+import math
+import threading
+from collections import OrderedDict, deque
+
+
+class AtomicCounter:
+    # plain int behind its own lock. Writers hold it for one addition and
+    # readers (dashboard polls) never modify anything, so concurrent
+    # reads all see the same value.
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self):
+        with self._lock:
+            self._value += 1
+
+    def add(self, n: int):
+        with self._lock:
+            self._value += n
+
+    def dec(self):
+        with self._lock:
+            self._value -= 1
+
+    def value(self):
+        return self._value
+
+
+def counter_for(counters: dict, key):
+    # dict.setdefault is atomic, so two threads racing on a new key
+    # still end up sharing one counter
+    c = counters.get(key)
+    if c is None:
+        c = counters.setdefault(key, AtomicCounter())
+    return c
+
+
+LATENCY_BINS = 256
+
+
+def latency_bin(seconds: float) -> int:
+    # log-spaced buckets, 16 per doubling of (ms + 1): ~4% wide each,
+    # bucket 255 covers everything past ~60 s
+    return min(LATENCY_BINS - 1, int(math.log2(max(0.0, seconds) * 1000.0 + 1.0) * 16))
+
+
+def latency_bin_ms(b: int) -> float:
+    # upper edge of bucket b in milliseconds
+    return 2.0 ** ((b + 1) / 16) - 1.0
+
+
+class _PyShardStats:
+    # running sum + histogram of one window shard. Mirrors ShardStats in
+    # _metrics_fast.pyx, which is used instead when it has been compiled.
+    __slots__ = ("total", "_hist")
+
+    def __init__(self):
+        self.total = 0.0
+        self._hist = [0] * LATENCY_BINS
+
+    def add(self, value):
+        self.total += value
+        self._hist[latency_bin(value)] += 1
+
+    def remove(self, value):
+        self.total -= value
+        self._hist[latency_bin(value)] -= 1
+
+    def counts(self):
+        return list(self._hist)
+
+
+try:
+    from server._metrics_fast import ShardStats
+except ImportError:
+    ShardStats = _PyShardStats
+
+
+class LatencyWindow:
+    # sliding window of the last `maxlen` samples split across shards,
+    # each with its own lock; merged only when the dashboard reads it.
+    # Samples are dealt round-robin rather than by thread id because the
+    # event loop records everything from a single thread.
+    # Every shard keeps a running sum and a histogram of the samples it
+    # holds, so the mean is O(shards) and percentiles are a scan over
+    # the bins instead of a sort of every sample.
+    def __init__(self, maxlen: int, shards: int = 8):
+        per_shard = max(1, maxlen // shards)
+        self._shards = [(deque(maxlen=per_shard), threading.Lock(), ShardStats())
+                        for _ in range(shards)]
+        self._ticket = itertools.count()
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        # a whole batch goes to one shard for a single lock round-trip
+        dq, lock, stats = self._shards[next(self._ticket) % len(self._shards)]
+        with lock:
+            for value in values:
+                if len(dq) == dq.maxlen:
+                    stats.remove(dq[0])
+                dq.append(value)
+                stats.add(value)
+
+    def values(self):
+        out = []
+        for dq, lock, _ in self._shards:
+            with lock:
+                out.extend(dq)
+        return out
+
+    def mean(self):
+        total, n = 0.0, 0
+        for dq, lock, stats in self._shards:
+            with lock:
+                total += stats.total
+                n += len(dq)
+        return total / n if n else 0.0
+
+    def percentile_ms(self, pct: float) -> float:
+        merged = [0] * LATENCY_BINS
+        for _, lock, stats in self._shards:
+            with lock:
+                counts = stats.counts()
+            for b, c in enumerate(counts):
+                merged[b] += c
+        total = sum(merged)
+        if not total:
+            return 0.0
+        target = math.ceil(total * pct / 100.0)
+        seen = 0
+        for b, c in enumerate(merged):
+            seen += c
+            if seen >= target:
+                return latency_bin_ms(b)
+        return latency_bin_ms(LATENCY_BINS - 1)
+
+
+class LRUDict(OrderedDict):
+    # size-bounded mapping: reads refresh an entry, inserts past maxsize
+    # drop the least recently used one. Optional default_factory works
+    # like defaultdict's. Not thread-safe on its own; callers hold a lock.
+    def __init__(self, maxsize: int, default_factory=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.default_factory = default_factory
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        value = self[key] = self.default_factory()
+        return value
+
+
+class BufferPool:
+    # free list of fixed-size bytearrays for recv_into. Per-thread buffers
+    # don't work on an event loop, where many connections share a thread.
+    # list.append/pop are atomic, so no lock is needed.
+    def __init__(self, size: int):
+        self.size = size
+        self._free = []
+
+    def acquire(self) -> bytearray:
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buf: bytearray):
+        self._free.append(buf)
@@ -2,6 +2,7 @@
 import threading
 import queue
 import time
+from concurrent.futures import Future
 from typing import Callable
 
 class ThreadPool:
@@ -19,19 +20,24 @@ class ThreadPool:
     def _worker(self):
         while not self.shutdown_flag.is_set():
             try:
-                func, args, kwargs = self.tasks.get(timeout=0.2)
+                fut, func, args, kwargs = self.tasks.get(timeout=0.2)
             except Exception:
                 continue
             try:
-                func(*args, **(kwargs or {}))
-            except Exception:
-                # swallow, worker must stay alive
-                pass
+                if fut.set_running_or_notify_cancel():
+                    fut.set_result(func(*args, **(kwargs or {})))
+            except Exception as e:
+                # hand the error to the waiter, worker must stay alive
+                fut.set_exception(e)
             finally:
                 self.tasks.task_done()
 
-    def submit(self, func: Callable, *args, **kwargs):
-        self.tasks.put((func, args, kwargs))
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        # returns a concurrent.futures.Future so the pool can be used
+        # as an executor for loop.run_in_executor
+        fut = Future()
+        self.tasks.put((fut, func, args, kwargs))
+        return fut
 
     def get_queue_size(self):
         return self.tasks.qsize()
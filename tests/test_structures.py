@@ -0,0 +1,59 @@
+import sys
+import threading
+import unittest
+
+from server.structures import AtomicCounter
+
+
+class AtomicCounterTest(unittest.TestCase):
+    def setUp(self):
+        self._interval = sys.getswitchinterval()
+        # switch threads as often as possible to shake out races
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self._interval)
+
+    def _run(self, targets):
+        threads = [threading.Thread(target=t) for t in targets]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_concurrent_reads_do_not_change_value(self):
+        c = AtomicCounter()
+        c.add(100)
+        seen = []
+
+        def reader():
+            seen.append({c.value() for _ in range(20_000)})
+
+        self._run([reader] * 4)
+        self.assertEqual(set().union(*seen), {100})
+        self.assertEqual(c.value(), 100)
+
+    def test_reads_during_writes(self):
+        c = AtomicCounter()
+        errors = []
+
+        def writer():
+            for _ in range(10_000):
+                c.inc()
+                c.add(2)
+
+        def reader():
+            last = 0
+            for _ in range(20_000):
+                v = c.value()
+                if v < last or v > 12 * 10_000:
+                    errors.append(v)
+                last = v
+
+        self._run([writer] * 4 + [reader] * 4)
+        self.assertEqual(errors, [])
+        self.assertEqual(c.value(), 4 * 10_000 * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()